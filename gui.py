@@ -133,11 +133,11 @@ class MainWindow(QMainWindow):
         self.append_log("开始生成...")
         try:
             gen = TesterScriptGenerator()
-            # 加载所有数据文件
+            # 加载所有数据文件，全部加载成功后再逐个记录
+            gen.load_data_from_csvs(data_files)
             for f in data_files:
                 var_name = os.path.splitext(os.path.basename(f))[0]
                 self.append_log(f"加载数据: {f} -> 变量名: {var_name}")
-                gen.load_data_from_csv(f, var_name)
 
             # 加载模板
             gen.load_template(template_path)
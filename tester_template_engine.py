@@ -7,17 +7,107 @@ Tester语言模板引擎 - 用于自动生成Tester语言测试脚本
 
 import re
 import csv
+import io
+import functools
 import argparse
 from typing import Dict, List, Tuple, Any, Optional, Union
 import os
+import shutil
 import logging
 import sys
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 from jinja2 import Environment, FileSystemLoader, Template
 
+__all__ = ["TesterSignal", "CsvData", "TemplateEngine", "TesterScriptGenerator"]
+
+# 可选依赖：cisv 为 C 实现的 CSV 解析器，大文件解析更快；未安装时使用标准库 csv
+try:
+    import cisv
+except ImportError:
+    cisv = None
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("TesterTemplateEngine")
 
+# 信号规范正则，预编译以避免每次编码/解码时重复解析
+_SIGNAL_SPEC_RE = re.compile(r"(0x[0-9A-Fa-f]+),([0-9]+)\.([0-9]+)-([0-9]+)\.([0-9]+)=(0x[0-9A-Fa-f]+)")
+_SIGNAL_DECODE_RE = re.compile(r"([0-9]+)\.([0-9]+)-([0-9]+)\.([0-9]+)")
+
+# 模板中 <variable_name> 形式的变量引用
+_TEMPLATE_VAR_RE = re.compile(r"<([^>]+)>")
+
+# 小于该字节数的CSV文件整体读入内存后再解析
+_CSV_SLURP_SIZE = 4_000_000
+
+@functools.lru_cache(maxsize=4096)
+def _parse_hex(text: str) -> int:
+    """解析十六进制字符串，报文数据中反复出现的字节直接命中缓存"""
+    return int(text, 16)
+
+
+@functools.lru_cache(maxsize=4096)
+def _generate_can_message(signal_spec: str) -> str:
+    """TesterSignal.generate_can_message 的实现
+
+    纯函数，输入输出均为字符串，模板中重复出现的信号规范直接命中缓存
+    """
+    try:
+        match = _SIGNAL_SPEC_RE.match(signal_spec)
+        if not match:
+            raise ValueError(f"信号规范格式无效: {signal_spec}")
+
+        can_id, start_byte, start_bit, end_byte, end_bit, value = match.groups()
+
+        # 将十六进制值转换为整数
+        value = int(value, 16)
+        
+        # 解析位域参数 (转换为0基索引)
+        start_byte = int(start_byte) - 1  # 转换为0基索引
+        start_bit = int(start_bit)
+        end_byte = int(end_byte) - 1      # 转换为0基索引
+        end_bit = int(end_bit)
+
+        if start_byte < 0:
+            raise ValueError(f"信号规范起始字节无效（从1开始）: {signal_spec}")
+
+        # 计算信号长度（总位数）
+        signal_length = (end_byte - start_byte) * 8 + (end_bit - start_bit) + 1
+
+        if signal_length <= 0 or signal_length > 64:
+            raise ValueError(f"信号长度无效: {signal_length}")
+
+        # 验证值是否超出信号长度能表示的范围
+        max_value = (1 << signal_length) - 1
+        if value > max_value:
+            raise ValueError(f"值 {value} 超出信号长度 {signal_length} 位能表示的范围 (最大: {max_value})")
+
+        # 根据Intel字节序放置信号值
+        # Intel格式：低位字节在前，位编号从LSB开始，
+        # 相当于把值左移到起始位后按小端序展开为8字节
+        packed = value << (start_byte * 8 + start_bit)
+        overflow = packed >> 64
+        if overflow:
+            # 报告第一个超出范围的置位所在的字节
+            first_bit_pos = 64 + (overflow & -overflow).bit_length() - 1
+            raise ValueError(f"位位置超出8字节范围: {first_bit_pos // 8}")
+        msg_data = packed.to_bytes(8, 'little')
+
+        # 转换数据为字符串格式
+        msg_data_str = msg_data.hex(' ').upper()
+
+        # 格式化CAN ID（去掉0x前缀）
+        if can_id.startswith("0x"):
+            can_id = can_id[2:]
+
+        return f"tcans {can_id},{msg_data_str}"
+        
+    except Exception as e:
+        logger.error("生成CAN报文出错: %s", e)
+        raise
+
+
 class TesterSignal:
     """CAN信号编码解码类,处理CAN报文中的信号位域"""
     
@@ -33,73 +123,7 @@ class TesterSignal:
         Returns:
             str: 格式化的tcans命令
         """
-        try:
-            import re
-            import logging
-            logger = logging.getLogger(__name__)
-            
-            match = re.match(r"(0x[0-9A-Fa-f]+),([0-9]+)\.([0-9]+)-([0-9]+)\.([0-9]+)=(0x[0-9A-Fa-f]+)", signal_spec)
-            if not match:
-                raise ValueError(f"信号规范格式无效: {signal_spec}")
-
-            can_id, start_byte, start_bit, end_byte, end_bit, value = match.groups()
-
-            # 将十六进制值转换为整数
-            value = int(value, 16)
-            
-            # 解析位域参数 (转换为0基索引)
-            start_byte = int(start_byte) - 1  # 转换为0基索引
-            start_bit = int(start_bit)
-            end_byte = int(end_byte) - 1      # 转换为0基索引
-            end_bit = int(end_bit)
-
-            # 计算信号长度（总位数）
-            signal_length = (end_byte - start_byte) * 8 + (end_bit - start_bit) + 1
-
-            if signal_length <= 0 or signal_length > 64:
-                raise ValueError(f"信号长度无效: {signal_length}")
-
-            # 验证值是否超出信号长度能表示的范围
-            max_value = (1 << signal_length) - 1
-            if value > max_value:
-                raise ValueError(f"值 {value} 超出信号长度 {signal_length} 位能表示的范围 (最大: {max_value})")
-
-            # 初始化8字节数据
-            msg_data = [0] * 8
-
-            # 根据Intel字节序放置信号值
-            # Intel格式：低位字节在前，位编号从LSB开始
-            current_bit_pos = start_byte * 8 + start_bit
-            
-            for i in range(signal_length):
-                # 检查当前信号位是否为1
-                if value & (1 << i):
-                    # 计算在CAN数据中的字节和位位置
-                    byte_idx = current_bit_pos // 8
-                    bit_idx = current_bit_pos % 8
-                    
-                    if byte_idx >= 8:
-                        raise ValueError(f"位位置超出8字节范围: {byte_idx}")
-                    
-                    # 设置对应位为1
-                    msg_data[byte_idx] |= (1 << bit_idx)
-                
-                current_bit_pos += 1
-
-            # 转换数据为字符串格式
-            msg_data_str = " ".join(f"{byte:02X}" for byte in msg_data)
-
-            # 格式化CAN ID（去掉0x前缀）
-            if can_id.startswith("0x"):
-                can_id = can_id[2:]
-
-            return f"tcans {can_id},{msg_data_str}"
-            
-        except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"生成CAN报文出错: {e}")
-            raise
+        return _generate_can_message(signal_spec)
     
     @staticmethod
     def decode_can_message(can_id: str, data: str, signal_spec: str) -> int:
@@ -114,9 +138,8 @@ class TesterSignal:
             int: 解码出的信号值
         """
         try:
-            import re
             # 解析信号规范
-            match = re.match(r"([0-9]+)\.([0-9]+)-([0-9]+)\.([0-9]+)", signal_spec)
+            match = _SIGNAL_DECODE_RE.match(signal_spec)
             if not match:
                 raise ValueError(f"信号规范格式无效: {signal_spec}")
 
@@ -126,84 +149,197 @@ class TesterSignal:
             end_byte = int(end_byte) - 1      # 转换为0基索引
             end_bit = int(end_bit)
 
+            if start_byte < 0:
+                raise ValueError(f"信号规范起始字节无效（从1开始）: {signal_spec}")
+
             # 解析CAN数据
-            data_bytes = [int(x, 16) for x in data.split()]
+            try:
+                data_bytes = bytearray(map(_parse_hex, data.split()))
+            except ValueError:
+                # 非十六进制或超出 00-FF 的字节
+                raise ValueError(f"CAN数据字节无效: {data}") from None
             if len(data_bytes) != 8:
                 raise ValueError(f"CAN数据长度必须为8字节: {len(data_bytes)}")
 
             # 计算信号长度
             signal_length = (end_byte - start_byte) * 8 + (end_bit - start_bit) + 1
 
-            # 提取信号值
-            result = 0
+            if signal_length <= 0:
+                raise ValueError(f"信号长度无效: {signal_length}")
+
+            # 提取信号值：按小端序合成64位整数后右移并截取信号长度
+            # 超过64位的信号必然越界，与原逐位实现一样报告第一个越界的字节
             current_bit_pos = start_byte * 8 + start_bit
+            if current_bit_pos + signal_length > 64:
+                raise ValueError(f"位位置超出8字节范围: {max(8, current_bit_pos // 8)}")
             
-            for i in range(signal_length):
-                byte_idx = current_bit_pos // 8
-                bit_idx = current_bit_pos % 8
-                
-                if byte_idx >= 8:
-                    raise ValueError(f"位位置超出8字节范围: {byte_idx}")
-                
-                # 检查对应位是否为1
-                if data_bytes[byte_idx] & (1 << bit_idx):
-                    result |= (1 << i)
-                
-                current_bit_pos += 1
+            raw = int.from_bytes(data_bytes, 'little')
+            result = (raw >> current_bit_pos) & ((1 << signal_length) - 1)
 
             return result
             
         except Exception as e:
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"解码CAN报文出错: {e}")
+            logger.error("解码CAN报文出错: %s", e)
             raise
 
+class CsvData(Sequence):
+    """CSV数据变量，按列分别存储键和值
+
+    行为与 (键, 值) 元组列表一致：迭代、下标与切片、``len``、``in``、``dict(变量)``、
+    与列表比较和相加（结果为列表）都与原来相同，模板中输出时也显示为列表。
+    另外可以通过 ``变量.key_list`` / ``变量.value_list`` 直接遍历单列。
+    唯一的区别是它不是 list 的实例，``tojson`` 等要求真正列表的场景需先用
+    ``变量|list`` 转换。
+    """
+
+    def __init__(self, key_list: List[str] = None, value_list: List[str] = None):
+        self.key_list = key_list if key_list is not None else []
+        self.value_list = value_list if value_list is not None else []
+
+    def __iter__(self):
+        return zip(self.key_list, self.value_list)
+
+    def __len__(self) -> int:
+        return len(self.key_list)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Tuple[str, str], List[Tuple[str, str]]]:
+        if isinstance(index, slice):
+            return list(zip(self.key_list[index], self.value_list[index]))
+        return self.key_list[index], self.value_list[index]
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (CsvData, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __add__(self, other: Any) -> List[Tuple[str, str]]:
+        if isinstance(other, (CsvData, list)):
+            return list(self) + list(other)
+        return NotImplemented
+
+    def __radd__(self, other: Any) -> List[Tuple[str, str]]:
+        if isinstance(other, list):
+            return other + list(self)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+
 class TemplateEngine:
     """Tester语言模板引擎，用于解析模板并生成测试脚本"""
     
     def __init__(self):
         self.variables = {}  # 存储模板变量
-        self.templates = {}  # 存储模板定义
+        self.templates = {}  # 存储编译后的模板
+        # 创建Jinja2模板环境，整个引擎实例共用
+        # 模板在加载时编译一次，无需检查模板源是否变化
+        self._env = Environment(autoescape=False, auto_reload=False, cache_size=400, optimized=True)
+        # 添加内置函数到模板环境
+        self._env.globals.update({
+            'len': len,
+            'enumerate': enumerate,
+            'range': range,
+            'str': str,
+            'int': int
+        })
     
-    def load_variables_from_csv(self, file_path: str, key_column: int = 0, value_column: int = 1, 
-                               has_header: bool = True, var_name: str = None) -> None:
-        """从CSV文件加载变量
+    def read_csv_data(self, file_path: str, key_column: int = 0, value_column: int = 1,
+                      has_header: bool = True, parallel: bool = False) -> CsvData:
+        """读取CSV文件中的键值数据（不注册为变量）
         
         Args:
             file_path: CSV文件路径
             key_column: 键列索引
             value_column: 值列索引
             has_header: 是否有标题行
-            var_name: 变量名，如不指定则使用文件名
+            parallel: 使用cisv时是否启用其多线程解析
+            
+        Returns:
+            CsvData: 按列存储的键值数据
         """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"找不到文件: {file_path}")
             
-        if var_name is None:
-            var_name = os.path.splitext(os.path.basename(file_path))[0]
-            
-        data = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            # 尝试自动检测分隔符
-            sample = f.readline()
-            if ';' in sample:
+        data = CsvData()
+        with open(file_path, 'r', encoding='utf-8', newline='', buffering=1 << 20) as f:
+            # 尝试自动检测分隔符（根据首行判断）
+            sample = f.read(4096)
+            if ';' in (sample.splitlines()[0] if sample else ''):
                 delimiter = ';'
             else:
                 delimiter = ','
-            f.seek(0)  # 回到文件开头
             
-            reader = csv.reader(f, delimiter=delimiter)
-            if has_header:
-                next(reader)  # 跳过标题行
-                
-            for row in reader:
-                if len(row) > max(key_column, value_column):
-                    # 保存为元组对
-                    data.append((row[key_column], row[value_column]))
+            if cisv is None:
+                if os.path.getsize(file_path) < _CSV_SLURP_SIZE:
+                    # 小文件一次性读入内存后解析，减少逐行读取的开销
+                    reader = csv.reader(io.StringIO(sample + f.read(), newline=''), delimiter=delimiter)
+                else:
+                    f.seek(0)  # 回到文件开头
+                    reader = csv.reader(f, delimiter=delimiter)
+                if has_header:
+                    next(reader)  # 跳过标题行
                     
+                for row in reader:
+                    if len(row) > max(key_column, value_column):
+                        # 按列分别保存键和值
+                        data.key_list.append(row[key_column])
+                        data.value_list.append(row[value_column])
+        
+        if cisv is not None:
+            rows = cisv.parse_file(file_path, delimiter=delimiter, skip_empty_lines=True, parallel=parallel)
+            rows = [row for row in rows[1 if has_header else 0:]
+                    if len(row) > max(key_column, value_column)]
+            data.key_list = [row[key_column] for row in rows]
+            data.value_list = [row[value_column] for row in rows]
+                    
+        return data
+    
+    def load_variables_from_csv(self, file_path: str, key_column: int = 0, value_column: int = 1, 
+                               has_header: bool = True, var_name: str = None) -> None:
+        """从CSV文件加载变量
+        
+        Args:
+            file_path: CSV文件路径
+            key_column: 键列索引
+            value_column: 值列索引
+            has_header: 是否有标题行
+            var_name: 变量名，如不指定则使用文件名
+        """
+        data = self.read_csv_data(file_path, key_column, value_column, has_header)
+        self._register_csv_data(file_path, data, var_name)
+    
+    def load_variables_from_csvs(self, file_paths: List[str]) -> None:
+        """并行读取多个CSV文件并加载为变量，变量名使用各自的文件名
+        
+        Args:
+            file_paths: CSV文件路径列表
+        """
+        if not file_paths:
+            return
+            
+        # 各文件在线程池中读取，结果在当前线程中统一写入变量，避免并发修改字典
+        with ThreadPoolExecutor(max_workers=min(8, len(file_paths))) as executor:
+            results = list(executor.map(functools.partial(self.read_csv_data, parallel=True), file_paths))
+            
+        for file_path, data in zip(file_paths, results):
+            self._register_csv_data(file_path, data)
+    
+    def _register_csv_data(self, file_path: str, data: CsvData, var_name: str = None) -> None:
+        """将读取的CSV数据注册为变量
+        
+        Args:
+            file_path: CSV文件路径
+            data: 读取的键值数据
+            var_name: 变量名，如不指定则使用文件名
+        """
+        if var_name is None:
+            var_name = os.path.splitext(os.path.basename(file_path))[0]
+            
         self.variables[var_name] = data
-        logger.info(f"从 {file_path} 加载了 {len(data)} 条数据到变量 {var_name}")
+        logger.info("从 %s 加载了 %d 条数据到变量 %s", file_path, len(data), var_name)
     
 
     
@@ -223,8 +359,8 @@ class TemplateEngine:
         with open(file_path, 'r', encoding='utf-8') as f:
             template_content = f.read()
             
-        self.templates[template_name] = template_content
-        logger.info(f"从 {file_path} 加载了模板 {template_name}")
+        self.templates[template_name] = self._env.from_string(template_content)
+        logger.info("从 %s 加载了模板 %s", file_path, template_name)
     
     def register_template(self, template_name: str, template_content: str) -> None:
         """注册模板
@@ -233,8 +369,8 @@ class TemplateEngine:
             template_name: 模板名称
             template_content: 模板内容
         """
-        self.templates[template_name] = template_content
-        logger.info(f"注册了模板 {template_name}")
+        self.templates[template_name] = self._env.from_string(template_content)
+        logger.info("注册了模板 %s", template_name)
     
     def register_variable(self, var_name: str, var_value: Any) -> None:
         """注册变量
@@ -244,7 +380,27 @@ class TemplateEngine:
             var_value: 变量值
         """
         self.variables[var_name] = var_value
-        logger.info(f"注册了变量 {var_name}")
+        logger.info("注册了变量 %s", var_name)
+    
+    def register_variables(self, variables: Dict[str, Any]) -> None:
+        """批量注册变量
+        
+        Args:
+            variables: 变量名到变量值的映射
+        """
+        self.variables.update(variables)
+        logger.info("注册了变量 %s", ", ".join(variables))
+    
+    def register_globals(self, functions: Dict[str, Any]) -> None:
+        """注册模板全局对象（如辅助函数）
+        
+        全局对象保存在模板环境中，渲染时无需随变量一起传入；与模板变量同名时以变量为准
+        
+        Args:
+            functions: 名称到对象的映射
+        """
+        self._env.globals.update(functions)
+        logger.info("注册了全局对象 %s", ", ".join(functions))
     
     def parse_template_variables(self, template: str) -> List[str]:
         """解析模板中的变量引用
@@ -256,11 +412,9 @@ class TemplateEngine:
             List[str]: 模板中引用的变量名列表
         """
         # 匹配 <variable_name> 格式的变量
-        pattern = r"<([^>]+)>"
-        matches = re.findall(pattern, template)
-        return matches
+        return _TEMPLATE_VAR_RE.findall(template)
     
-    def render_template(self, template_name: str, output_file: str = None) -> str:
+    def render_template(self, template_name: str, output_file: str = None) -> Optional[str]:
         """渲染模板并生成测试脚本
         
         Args:
@@ -268,39 +422,40 @@ class TemplateEngine:
             output_file: 输出文件路径，如不指定则只返回渲染结果
             
         Returns:
-            str: 渲染后的测试脚本内容
+            Optional[str]: 渲染后的测试脚本内容；指定输出文件时边渲染边写入，返回None
         """
         if template_name not in self.templates:
             raise KeyError(f"未找到模板: {template_name}")
             
-        template_content = self.templates[template_name]
+        # 模板在加载时已编译，重复渲染无需再次解析
+        template = self.templates[template_name]
         
         try:
-            # 创建Jinja2模板环境
-            env = Environment()
-            # 添加内置函数到模板环境
-            env.globals.update({
-                'len': len,
-                'enumerate': enumerate,
-                'range': range,
-                'str': str,
-                'int': int
-            })
-            template = env.from_string(template_content)
-            
-            # 渲染模板
-            result = template.render(**self.variables)
-            
-            # 写入输出文件
+            # 写入输出文件：流式渲染，避免在内存中拼接完整结果
+            # 先写入同目录下的临时文件，渲染成功后再替换目标文件，失败时保留原文件
             if output_file:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(result)
-                logger.info(f"已将渲染结果写入文件: {output_file}")
+                # 目标为符号链接时替换其指向的文件，保留链接本身
+                target_file = os.path.realpath(output_file)
+                temp_file = f"{target_file}.{os.getpid()}.tmp"
+                try:
+                    with open(temp_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                        template.stream(**self.variables).dump(f)
+                    if os.path.exists(target_file):
+                        # 沿用原文件的权限
+                        shutil.copymode(target_file, temp_file)
+                    os.replace(temp_file, target_file)
+                except BaseException:
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
+                    raise
+                logger.info("已将渲染结果写入文件: %s", output_file)
+                return None
             
-            return result
+            # 渲染模板
+            return template.render(**self.variables)
             
         except Exception as e:
-            logger.error(f"渲染模板时出错: {e}")
+            logger.error("渲染模板时出错: %s", e)
             raise
 
 
@@ -319,6 +474,14 @@ class TesterScriptGenerator:
         """
         self.template_engine.load_variables_from_csv(file_path, var_name=var_name)
     
+    def load_data_from_csvs(self, file_paths: List[str]) -> None:
+        """并行加载多个CSV数据文件，变量名使用各自的文件名
+        
+        Args:
+            file_paths: CSV文件路径列表
+        """
+        self.template_engine.load_variables_from_csvs(file_paths)
+    
     def load_template(self, file_path: str, template_name: str = None) -> None:
         """加载模板
         
@@ -336,11 +499,11 @@ class TesterScriptGenerator:
             output_file: 输出文件路径
         """
         # 注册辅助函数到模板引擎
-        self.template_engine.register_variable("encode_signal", TesterSignal.generate_can_message)
+        self.template_engine.register_globals({"encode_signal": TesterSignal.generate_can_message})
         
         # 渲染模板并生成脚本
         self.template_engine.render_template(template_name, output_file)
-        logger.info(f"成功生成测试脚本: {output_file}")
+        logger.info("成功生成测试脚本: %s", output_file)
 
 
 def main():
@@ -361,9 +524,7 @@ def main():
         generator = TesterScriptGenerator()
         
         # 加载所有CSV数据文件
-        for data_file in args.data:
-            var_name = os.path.splitext(os.path.basename(data_file))[0]
-            generator.load_data_from_csv(data_file, var_name)
+        generator.load_data_from_csvs(args.data)
         
         # 加载模板并生成脚本
         generator.load_template(args.template)
@@ -374,7 +535,7 @@ def main():
         return 0
         
     except Exception as e:
-        logger.error(f"生成脚本时出错: {e}")
+        logger.error("生成脚本时出错: %s", e)
         return 1
 
 